@@ -14,6 +14,16 @@
 
 import json
 
+# Use orjson to decode relation data if it is available in the charm,
+# otherwise fall back to json.  Data is always encoded with json so that the
+# string sent doesn't depend on which library is installed.
+try:
+    import orjson
+
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
 import charms.reactive as reactive
 
 
@@ -144,7 +154,7 @@ class ManilaPluginProvides(reactive.RelationBase):
         data = self._authentication_data()
         if data is None:
             return None
-        return json.loads(data)["data"]
+        return _loads(data)["data"]
 
     @property
     def configuration_data(self):
@@ -153,7 +163,7 @@ class ManilaPluginProvides(reactive.RelationBase):
         data = self.get_local('_configuration_data', default=None, scope=scope)
         if data is None:
             return
-        return json.loads(data)["data"]
+        return _loads(data)["data"]
 
     @configuration_data.setter
     def configuration_data(self, data):
@@ -181,7 +191,6 @@ class ManilaPluginProvides(reactive.RelationBase):
         :param data: object that describes the plugin data to be sent.
         """
         scope = self.conversations()[0].scope
-        self.set_local(_configuration_data=json.dumps({"data": data}),
-                       scope=scope)
-        self.set_remote(_configuration_data=json.dumps({"data": data}),
-                        scope=scope)
+        payload = json.dumps({"data": data})
+        self.set_local(_configuration_data=payload, scope=scope)
+        self.set_remote(_configuration_data=payload, scope=scope)
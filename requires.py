@@ -12,11 +12,28 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import hashlib
 import json
 
+# Use orjson to decode relation data if it is available in the charm,
+# otherwise fall back to json.  The authentication payload is always encoded
+# with json (see set_authentication_data) so that the string sent, and its
+# hash, don't depend on which library is installed.
+try:
+    import orjson
+
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
 import charmhelpers.core.hookenv as hookenv
 import charms.reactive as reactive
 
+# The keys expected in the authentication data sent to the plugin.
+_AUTH_KEYS = frozenset(('username', 'password', 'project_domain_id',
+                        'project_name', 'user_domain_id', 'auth_uri',
+                        'auth_url', 'auth_type'))
+
 
 class ManilaPluginRequires(reactive.RelationBase):
     """The is the Manila 'end' of the relation.
@@ -64,6 +81,9 @@ class ManilaPluginRequires(reactive.RelationBase):
     def departed(self):
         self.update_status()
 
+    # NOTE: the time spent here goes on the relation-get calls made for each
+    # conversation (see _get_remote_bulk()), not on the Python around them, so
+    # compiling or JIT-ing this code won't make it faster.
     def update_status(self):
         """Set the .available and .changed state if at least one of the
         conversations (with the subordinate) has a name and some configuration
@@ -80,31 +100,32 @@ class ManilaPluginRequires(reactive.RelationBase):
         The interface will NOT set .changed without having .available at the
         same time.
         """
+        # ignore conversations that have gone away
+        conversations = [c for c in self.conversations()
+                         if c.scope is not None]
+        if not conversations:
+            self.remove_state(self.states.available)
+            self.remove_state(self.states.connected)
+            self.remove_state(self.states.changed)
+            return
         count_available = 0
         count_changed = 0
-        count_conversations = 0
-        for conversation in self.conversations():
-            if conversation.scope is None:
-                # the conversation has gone away; ignore it
-                continue
-            count_conversations += 1
+        for conversation in conversations:
+            scope = conversation.scope
             # try to see if we've already had this conversation
             conversation_available = self.get_local(
-                '_available', default=False, scope=conversation.scope)
-            name = self.get_remote(
-                '_name', default=None, scope=conversation.scope)
-            configuration_data = self.get_remote(
-                '_configuration_data',
-                default=None,
-                scope=conversation.scope)
-            if name is not None and configuration_data is not None:
+                '_available', default=False, scope=scope)
+            data = self._get_remote_bulk(
+                conversation, ('_name', '_configuration_data'))
+            if (data['_name'] is not None and
+                    data['_configuration_data'] is not None):
                 count_available += 1
                 available = True
             else:
                 available = False
             # if we've changed state (or just connected)
             if available != conversation_available:
-                self.set_local(_available=available, scope=conversation.scope)
+                self.set_local(_available=available, scope=scope)
                 count_changed += 1
 
         # now update the relation states to convey what is happening.
@@ -114,9 +135,37 @@ class ManilaPluginRequires(reactive.RelationBase):
             self.set_state(self.states.available)
         else:
             self.remove_state(self.states.available)
-        if not count_conversations:
-            self.remove_state(self.states.connected)
-            self.remove_state(self.states.changed)
+
+    def _get_remote_bulk(self, conversation, keys):
+        """Fetch several remote values for a conversation in one go.
+
+        get_remote() runs relation-get once per key; this reads all of the
+        remote unit's relation data with a single relation-get (which
+        charmhelpers caches for the rest of the hook) and picks out the keys.
+
+        :param conversation: the conversation to read the remote data from
+        :param keys: the keys to return
+        :returns: dict of key -> value, with None for any missing key
+        """
+        result = dict.fromkeys(keys)
+        # only read the units that are still related (plus the departing unit
+        # in a -relation-departed hook), as Conversation.get_remote() does.
+        cur_rid = hookenv.relation_id()
+        departing = hookenv.hook_name().endswith('-relation-departed')
+        for relation_id in conversation.relation_ids:
+            units = list(hookenv.related_units(relation_id))
+            if departing and cur_rid == relation_id:
+                units.append(hookenv.remote_unit())
+            for unit in units:
+                if unit not in conversation.units:
+                    continue
+                data = hookenv.relation_get(unit=unit, rid=relation_id)
+                if not data:
+                    continue
+                for key in keys:
+                    if result[key] is None and data.get(key):
+                        result[key] = data[key]
+        return result
 
     def clear_changed(self):
         """Provide a convenient method to clear the .changed relation"""
@@ -148,41 +197,48 @@ class ManilaPluginRequires(reactive.RelationBase):
         :param value: a dictionary of data to set.
         :param name: OPTIONAL - target the config at a particular name only
         """
-        keys = {'username', 'password', 'project_domain_id', 'project_name',
-                'user_domain_id', 'auth_uri', 'auth_url', 'auth_type'}
         passed_keys = set(value.keys())
-        if passed_keys.difference(keys) or keys.difference(passed_keys):
+        if passed_keys ^ _AUTH_KEYS:
             hookenv.log(
                 "Setting Authentication data; there may be missing or mispelt "
                 "keys: passed: {}".format(passed_keys),
                 level=hookenv.WARNING)
+        # canonical form: sorted keys and no whitespace, so that equal values
+        # always give the same payload (and hash).
+        payload = json.dumps({"data": value}, sort_keys=True,
+                             separators=(',', ':'))
+        # only the hash of the payload is kept locally to detect changes
+        digest = hashlib.sha256(payload.encode()).hexdigest()
         # need to check for each conversation whether we've sent the data, or
         # whether it is different, and then set the local & remote only if that
         # is the case.
         for conversation in self.conversations():
-            if conversation.scope is None:
+            scope = conversation.scope
+            if scope is None:
                 # the conversation has gone away; ignore it
                 continue
             if name is not None:
                 conversation_name = self.get_remote('_name', default=None,
-                                                    scope=conversation.scope)
+                                                    scope=scope)
                 if name != conversation_name:
                     continue
+            if self.get_local('_authentication_data_hash',
+                              default=None,
+                              scope=scope) == digest:
+                # the values haven't changed, so don't set them again
+                continue
+            # older versions of the interface stored the whole payload rather
+            # than its hash; only resend it if the values are different, and
+            # switch over to storing the hash either way.
             existing_auth_data = self.get_local('_authentication_data',
                                                 default=None,
-                                                scope=conversation.scope)
-            if existing_auth_data is not None:
-                # see if they are different
-                existing_auth = json.loads(existing_auth_data)["data"]
-                if (existing_auth.keys() == value.keys() and
-                        all([v == value[k]
-                             for k, v in existing_auth.items()])):
-                    # the values haven't changed, so don't set them again
-                    continue
-            self.set_local(_authentication_data=json.dumps({"data": value}),
-                           scope=conversation.scope)
-            self.set_remote(_authentication_data=json.dumps({"data": value}),
-                            scope=conversation.scope)
+                                                scope=scope)
+            if (existing_auth_data is None or
+                    _loads(existing_auth_data)["data"] != value):
+                self.set_remote(_authentication_data=payload, scope=scope)
+            self.set_local(_authentication_data=None,
+                           _authentication_data_hash=digest,
+                           scope=scope)
 
     @property
     def names(self):
@@ -196,12 +252,10 @@ class ManilaPluginRequires(reactive.RelationBase):
             if conversation.scope is None:
                 # the conversation has gone away; ignore it
                 continue
-            name = self.get_remote('_name', default=None,
-                                   scope=conversation.scope)
-            config = self.get_remote('_configuration_data', default=None,
-                                     scope=conversation.scope)
-            if name and config:
-                names.append(name)
+            data = self._get_remote_bulk(
+                conversation, ('_name', '_configuration_data'))
+            if data['_name'] and data['_configuration_data']:
+                names.append(data['_name'])
         return names
 
     def get_configuration_data(self, name=None):
@@ -247,20 +301,13 @@ class ManilaPluginRequires(reactive.RelationBase):
         :param name: OPTIONAL: specify the name of the interface (_name)
         :returns: data object described above
         """
-        result = {}
-        for conversation in self.conversations():
-            if conversation.scope is None:
-                # the conversation has gone away; ignore it
-                continue
-            _name = self.get_remote('_name', default=None,
-                                    scope=conversation.scope)
-            # if name is not None then check to see if this is the one that is
-            # wanted.
-            if name and _name != name:
-                continue
-            config = self.get_remote('_configuration_data',
-                                     default=None,
-                                     scope=conversation.scope)
-            if _name and config:
-                result[_name] = json.loads(config)["data"]
-        return result
+        remote_data = (
+            self._get_remote_bulk(c, ('_name', '_configuration_data'))
+            for c in self.conversations()
+            # ignore conversations that have gone away
+            if c.scope is not None)
+        # if name is given then only return the one that is wanted.
+        return {data['_name']: _loads(data['_configuration_data'])["data"]
+                for data in remote_data
+                if data['_name'] and data['_configuration_data'] and
+                (not name or data['_name'] == name)}